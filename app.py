@@ -5,17 +5,22 @@ Files included in this single-file app:
 - app.py (this file)
 
 Requirements (paste into requirements.txt):
-streamlit
-moviepy
-requests
+streamlit>=1.37
 Pillow
 numpy
 pydub
 validators
+aiohttp
+aiofiles
+nest_asyncio
+pandas
+orjson
+Brotli
 
 Notes:
 - This app uses the Pexels API for image and video search. Get a free API key from https://www.pexels.com/api/ and set it as an environment variable `PEXELS_API_KEY` or put it in Streamlit secrets under `PEXELS_API_KEY`.
-- MoviePy requires ffmpeg installed on your system (install via apt, brew, or download from ffmpeg.org).
+- Rendering runs ffmpeg/ffprobe directly, so both must be installed on your system (install via apt, brew, or download from ffmpeg.org).
+- Downloaded Pexels assets are cached in ~/.cache/streamlit_video_editor (capped at 2 GB; override with `VIDEO_EDITOR_CACHE_MAX_BYTES`).
 - This is a simple editor: you can search & add online images/videos, upload local files, trim, reorder, and export a combined video.
 
 Run:
@@ -24,17 +29,32 @@ streamlit run streamlit_video_editor_app.py
 """
 
 import streamlit as st
-import requests
 import os
+import asyncio
+import random
+import time
+import hashlib
+import aiohttp
+import aiofiles
+import nest_asyncio
 import tempfile
-from moviepy.editor import VideoFileClip, ImageClip, concatenate_videoclips, AudioFileClip
-from PIL import Image
+import subprocess
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import BytesIO
+from PIL import Image
+import pandas as pd
 import validators
 import json
+import orjson
+from fractions import Fraction
 
 st.set_page_config(page_title="Streamlit Video Editor", layout="wide")
 
+# allow asyncio.run() even if the Streamlit thread already has a running loop
+nest_asyncio.apply()
+
 # ---------------------- Utility functions ----------------------
 def get_pexels_api_key():
     # Priority: st.secrets -> env var
@@ -45,45 +65,647 @@ def get_pexels_api_key():
         key = os.environ.get("CdatHQezjqI1tA5zbPR6dlxFqRoBMBQ7DueRmPTCJCjs2kvRCPelckfE")
     return key
 
-def pexels_search_images(query, per_page=8):
+PEXELS_IMAGE_SEARCH_URL = "https://api.pexels.com/v1/search"
+PEXELS_VIDEO_SEARCH_URL = "https://api.pexels.com/videos/search"
+THUMB_MAX_PARALLEL = 10
+SEARCH_CACHE_SIZE = 64
+SEARCH_CACHE_TTL = 3600
+THUMB_SIZE = (300, 300)
+THUMB_CACHE_SIZE = 200
+
+def image_thumb_url(r):
+    return r.get("src", {}).get("medium")
+
+def video_thumb_url(r):
+    return r.get("image")
+
+async def _fetch_thumb(session, sem, url):
+    async with sem:
+        try:
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                return url, await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            # leave it out of the cache; st.image falls back to the remote URL
+            return url, None
+
+class PexelsSearchError(Exception):
+    pass
+
+async def _fetch_search(url, params, api_key):
+    timeout = aiohttp.ClientTimeout(total=15)
+    # no explicit Accept-Encoding: aiohttp already offers gzip/deflate, plus br
+    # only when the Brotli package is importable, so it can always decode
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(url, params=params, headers={"Authorization": api_key}) as resp:
+            if resp.status != 200:
+                raise PexelsSearchError(resp.status)
+            # aiohttp has already undone the gzip/br transfer encoding here
+            return orjson.loads(await resp.read())
+
+async def _prefetch_thumbs(thumb_urls):
+    timeout = aiohttp.ClientTimeout(total=15)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        sem = asyncio.Semaphore(THUMB_MAX_PARALLEL)
+        fetched = await asyncio.gather(*[_fetch_thumb(session, sem, u) for u in thumb_urls])
+    return {u: b for u, b in fetched if b is not None}
+
+# st.cache_data rather than functools.lru_cache: Streamlit re-executes this
+# script on every interaction, so a module-level lru_cache starts empty each run
+@st.cache_data(ttl=SEARCH_CACHE_TTL, max_entries=SEARCH_CACHE_SIZE, show_spinner=False)
+def _cached_search(url, result_key, query, per_page, api_key):
+    # failures raise, and st.cache_data never stores a raised call
+    data = asyncio.run(_fetch_search(url, {"query": query, "per_page": per_page}, api_key))
+    return data.get(result_key, [])
+
+def _pexels_search(kind, url, result_key, thumb_of, query, per_page):
     api_key = get_pexels_api_key()
     if not api_key:
         st.error("Pexels API key not found. Set PEXELS_API_KEY in Streamlit secrets or env variables.")
         return []
-    url = "https://api.pexels.com/v1/search"
-    params = {"query": query, "per_page": per_page}
-    headers = {"Authorization": api_key}
-    r = requests.get(url, params=params, headers=headers, timeout=15)
-    if r.status_code != 200:
-        st.warning(f"Pexels image search failed: {r.status_code}")
+    try:
+        results = _cached_search(url, result_key, query, per_page, api_key)
+    except PexelsSearchError as e:
+        st.warning(f"Pexels {kind} search failed: {e}")
         return []
-    data = r.json()
-    return data.get("photos", [])
+    thumb_cache = st.session_state.setdefault("thumb_cache", {})
+    missing = {thumb_of(r) for r in results} - set(thumb_cache) - {None}
+    if missing:
+        for url, data in asyncio.run(_prefetch_thumbs(missing)).items():
+            img = decode_thumb(data)
+            if img is not None:
+                thumb_cache[url] = img
+        # dicts keep insertion order, so the oldest thumbnails go first
+        while len(thumb_cache) > THUMB_CACHE_SIZE:
+            del thumb_cache[next(iter(thumb_cache))]
+    return results
+
+def pexels_search_images(query, per_page=8):
+    return _pexels_search("image", PEXELS_IMAGE_SEARCH_URL, "photos", image_thumb_url, query, per_page)
 
 def pexels_search_videos(query, per_page=6):
-    api_key = get_pexels_api_key()
-    if not api_key:
-        st.error("Pexels API key not found. Set PEXELS_API_KEY in Streamlit secrets or env variables.")
-        return []
-    url = "https://api.pexels.com/videos/search"
-    params = {"query": query, "per_page": per_page}
-    headers = {"Authorization": api_key}
-    r = requests.get(url, params=params, headers=headers, timeout=15)
-    if r.status_code != 200:
-        st.warning(f"Pexels video search failed: {r.status_code}")
-        return []
-    data = r.json()
-    return data.get("videos", [])
-
-def download_url_to_file(url, dest_path):
-    r = requests.get(url, stream=True, timeout=30)
-    r.raise_for_status()
-    with open(dest_path, "wb") as f:
-        for chunk in r.iter_content(chunk_size=8192):
-            if chunk:
-                f.write(chunk)
+    return _pexels_search("video", PEXELS_VIDEO_SEARCH_URL, "videos", video_thumb_url, query, per_page)
+
+def decode_thumb(data):
+    # decode once and shrink, so reruns hand st.image a small ready-made image
+    try:
+        img = Image.open(BytesIO(data))
+        img.thumbnail(THUMB_SIZE)
+        img.load()
+    except (OSError, Image.DecompressionBombError):
+        return None
+    return img
+
+async def _fetch_bytes(url):
+    timeout = aiohttp.ClientTimeout(total=5)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        async with session.get(url) as resp:
+            resp.raise_for_status()
+            return await resp.read()
+
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def _download_bytes(url):
+    # None is cached too, so a dead URL is not retried on every rerun
+    try:
+        return asyncio.run(_fetch_bytes(url))
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return None
+
+def thumb_source(url):
+    # the decoded thumbnail when we have it; retry a missed prefetch through the
+    # shared byte cache, and only then let the browser fetch the URL
+    thumb_cache = st.session_state.setdefault("thumb_cache", {})
+    if url in thumb_cache or url is None:
+        return thumb_cache.get(url, url)
+    data = _download_bytes(url)
+    img = decode_thumb(data) if data else None
+    if img is None:
+        return url
+    thumb_cache[url] = img
+    return img
+
+# Segmented downloads: files above DOWNLOAD_CHUNK_SIZE are fetched as parallel
+# HTTP Range requests and written into a pre-allocated file at their offsets.
+DOWNLOAD_CHUNK_SIZE = 2 * 1024 * 1024
+DOWNLOAD_MAX_PARALLEL = 8
+DOWNLOAD_MAX_RETRIES = 5
+DOWNLOAD_WRITE_SIZE = 1024 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# compressed responses would break byte offsets, so always ask for the raw bytes
+DOWNLOAD_HEADERS = {"Accept-Encoding": "identity"}
+
+class RetryableHTTPError(Exception):
+    pass
+
+class RangeNotSupported(Exception):
+    pass
+
+async def _with_backoff(fn, *args):
+    # exponential backoff with full jitter on 429/5xx, connection errors and
+    # bodies cut off mid-transfer
+    for attempt in range(DOWNLOAD_MAX_RETRIES):
+        try:
+            return await fn(*args)
+        except (RetryableHTTPError, aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError):
+            if attempt == DOWNLOAD_MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(random.uniform(0, min(30, 0.5 * 2 ** attempt)))
+
+def _check_status(resp):
+    if resp.status in RETRY_STATUSES:
+        raise RetryableHTTPError(f"{resp.status} for {resp.url}")
+    resp.raise_for_status()
+
+async def _copy_body(resp, f):
+    # the socket hands back whatever has arrived (often a few KB); coalesce it
+    # so each aiofiles write - one thread-pool hop - moves a full buffer
+    buf = bytearray()
+    async for chunk in resp.content.iter_any():
+        buf += chunk
+        if len(buf) >= DOWNLOAD_WRITE_SIZE:
+            await f.write(buf)
+            buf = bytearray()
+    if buf:
+        await f.write(buf)
+
+async def _probe_size(session, url):
+    # returns Content-Length if the server accepts byte ranges, else None
+    async with session.head(url, allow_redirects=True) as resp:
+        if resp.status in RETRY_STATUSES:
+            raise RetryableHTTPError(f"{resp.status} for {resp.url}")
+        # GET-only endpoints (e.g. signed URLs) answer HEAD with 403/405;
+        # treat that as "no range support" and let the plain GET decide
+        if not resp.ok or resp.headers.get("Accept-Ranges", "").lower() != "bytes":
+            return None
+        size = resp.headers.get("Content-Length")
+        return int(size) if size else None
+
+async def _download_range(session, sem, url, dest_path, start, end):
+    async with sem:
+        headers = {"Range": f"bytes={start}-{end}"}
+        async with session.get(url, headers=headers) as resp:
+            _check_status(resp)
+            if resp.status != 206:
+                # the server advertised ranges but sent the whole body; a
+                # retry would get the same answer
+                raise RangeNotSupported(f"range request ignored ({resp.status}) for {url}")
+            async with aiofiles.open(dest_path, "r+b") as f:
+                await f.seek(start)
+                await _copy_body(resp, f)
+
+async def _download_whole(session, url, dest_path):
+    async with session.get(url) as resp:
+        _check_status(resp)
+        async with aiofiles.open(dest_path, "wb") as f:
+            await _copy_body(resp, f)
+
+async def _download_segmented(url, dest_path, max_parallel=DOWNLOAD_MAX_PARALLEL):
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=30)
+    async with aiohttp.ClientSession(timeout=timeout, headers=DOWNLOAD_HEADERS) as session:
+        size = await _with_backoff(_probe_size, session, url)
+        if not size or size <= DOWNLOAD_CHUNK_SIZE:
+            await _with_backoff(_download_whole, session, url, dest_path)
+            return dest_path
+        # pre-allocate so every segment can seek to its own offset
+        with open(dest_path, "wb") as f:
+            f.truncate(size)
+        sem = asyncio.Semaphore(max_parallel)
+        ranges = [(start, min(start + DOWNLOAD_CHUNK_SIZE, size) - 1) for start in range(0, size, DOWNLOAD_CHUNK_SIZE)]
+        tasks = [
+            asyncio.ensure_future(_with_backoff(_download_range, session, sem, url, dest_path, start, end))
+            for start, end in ranges
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except RangeNotSupported:
+            # stop the other segments before rewriting the file in one piece
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await _with_backoff(_download_whole, session, url, dest_path)
     return dest_path
 
+# Downloaded assets live in a content-addressed cache (file name = hash of the
+# URL), so the same Pexels asset is fetched once and shared across sessions and
+# restarts. Once the cache passes ASSET_CACHE_MAX_BYTES the least recently used
+# files (by atime) are removed.
+ASSET_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "streamlit_video_editor")
+ASSET_CACHE_MAX_BYTES = int(os.environ.get("VIDEO_EDITOR_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+PARTIAL_SUFFIX = ".part"
+
+def asset_cache_path(url, suffix):
+    key = hashlib.blake2b(url.encode(), digest_size=16).hexdigest()
+    return os.path.join(ASSET_CACHE_DIR, key + suffix)
+
+def _evict_assets(keep):
+    # never delete what this session's timeline points at; other sessions
+    # recover through ensure_local
+    in_use = {item["path"] for item in st.session_state.get("timeline", [])} | {keep}
+    entries = []
+    with os.scandir(ASSET_CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith(PARTIAL_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= ASSET_CACHE_MAX_BYTES:
+            break
+        if path in in_use:
+            continue
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # another session got there first
+        total -= size
+
+def ensure_local(item):
+    # the cache is shared by every session, so another session's eviction can
+    # remove a file this timeline still uses; downloaded items keep their URL
+    # and are fetched again on demand
+    if not os.path.exists(item['path']) and item.get('url'):
+        item['path'] = download_url_to_file(item['url'], item['suffix'])
+    return item['path']
+
+def download_url_to_file(url, suffix):
+    dest_path = asset_cache_path(url, suffix)
+    if os.path.exists(dest_path) and os.path.getsize(dest_path) > 0:
+        # relatime mounts rarely update atime on read, so mark the hit ourselves;
+        # mtime is left alone because it keys the ffprobe cache
+        os.utime(dest_path, (time.time(), os.path.getmtime(dest_path)))
+        return dest_path
+    os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+    # download next to the final name and rename, so a half-written file is
+    # never mistaken for a cache hit
+    fd, part_path = tempfile.mkstemp(suffix=PARTIAL_SUFFIX, dir=ASSET_CACHE_DIR)
+    os.close(fd)
+    try:
+        asyncio.run(_download_segmented(url, part_path))
+        os.replace(part_path, dest_path)
+    except Exception:
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+        raise
+    _evict_assets(keep=dest_path)
+    return dest_path
+
+# ---------------------- Rendering ----------------------
+# The export is a single ffmpeg run: every timeline item becomes one input and
+# one concat segment, so decoding, scaling and encoding all stay inside ffmpeg.
+AUDIO_RATE = 44100
+
+# st.cache_data so probes survive reruns (a module-level lru_cache would not)
+@st.cache_data(max_entries=256, show_spinner=False)
+def _ffprobe_cached(path, mtime, size):
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_streams", "-show_format", "-of", "json", path],
+        capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout)
+
+def ffprobe(path):
+    # keyed on mtime/size as well so a rewritten file is probed again
+    return _ffprobe_cached(path, os.path.getmtime(path), os.path.getsize(path))
+
+def first_stream(path, codec_type):
+    for s in ffprobe(path).get("streams", []):
+        if s.get("codec_type") == codec_type:
+            return s
+    return None
+
+def has_audio(path):
+    return first_stream(path, "audio") is not None
+
+# Stream properties that must agree for the concat demuxer to join files
+# without re-encoding.
+COPY_VIDEO_KEYS = ("codec_name", "profile", "width", "height", "pix_fmt", "time_base", "r_frame_rate")
+COPY_AUDIO_KEYS = ("codec_name", "sample_rate", "channels")
+
+def stream_copy_compatible(timeline, width, height, fps):
+    # only untrimmed videos that already match the export settings qualify;
+    # anything else has to go through the filter graph
+    signatures = set()
+    for item in timeline:
+        if item['type'] != 'video' or float(item.get('start', 0) or 0) > 0 or item.get('end'):
+            return False
+        v = first_stream(item['path'], "video")
+        if v is None or v.get("codec_name") != "h264":
+            return False
+        if (v.get("width"), v.get("height")) != (width, height):
+            return False
+        if Fraction(v.get("r_frame_rate", "0/1")) != fps:
+            return False
+        a = first_stream(item['path'], "audio")
+        signatures.add((
+            tuple(v.get(k) for k in COPY_VIDEO_KEYS),
+            tuple(a.get(k) for k in COPY_AUDIO_KEYS) if a else None,
+        ))
+    return len(signatures) == 1
+
+def write_concat_list(timeline, list_path):
+    with open(list_path, "w") as f:
+        for item in timeline:
+            escaped = item['path'].replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+def build_stream_copy_command(list_path, out_path):
+    return [
+        "ffmpeg", "-hide_banner", "-y",
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-c", "copy", "-movflags", "+faststart",
+        out_path,
+    ]
+
+# Hardware H.264 encoders, in the order "auto" prefers them. Each maps to its
+# encoder flags and the -hwaccel used for decoding video inputs (if any).
+HW_ENCODERS = {
+    "h264_nvenc": {"args": ["-preset", "p4", "-tune", "hq"], "pix_fmt": "yuv420p", "hwaccel": "cuda"},
+    "h264_qsv": {"args": [], "pix_fmt": "nv12", "hwaccel": None},
+    "h264_videotoolbox": {"args": [], "pix_fmt": "yuv420p", "hwaccel": "videotoolbox"},
+}
+SOFTWARE_ENCODER = {"args": [], "pix_fmt": "yuv420p", "hwaccel": None}
+X264_PRESETS = ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"]
+DEFAULT_PRESET = "veryfast"
+DEFAULT_CRF = 23
+ENCODER_PROBE_TIMEOUT = 10
+
+def _encoder_works(name):
+    # being listed by -encoders only means ffmpeg was built with it; a tiny
+    # test encode tells us whether the GPU/driver is actually there
+    try:
+        proc = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-v", "error", "-f", "lavfi", "-i", "color=s=256x256:d=0.1",
+             "-c:v", name, "-f", "null", "-"],
+            capture_output=True, timeout=ENCODER_PROBE_TIMEOUT,
+        )
+    except subprocess.TimeoutExpired:
+        # a driver that hangs on init is as good as missing
+        return False
+    return proc.returncode == 0
+
+# cache_resource, not lru_cache: the script re-executes on every interaction,
+# and this must run once per process rather than on every rerun
+@st.cache_resource(show_spinner=False)
+def available_hw_encoders():
+    try:
+        out = subprocess.run(
+            ["ffmpeg", "-hide_banner", "-encoders"],
+            capture_output=True, text=True, timeout=ENCODER_PROBE_TIMEOUT,
+        ).stdout
+    except (FileNotFoundError, subprocess.TimeoutExpired):
+        return ()
+    listed = {line.split()[1] for line in out.splitlines() if len(line.split()) > 1}
+    return tuple(name for name in HW_ENCODERS if name in listed and _encoder_works(name))
+
+def resolve_encoder(choice):
+    if choice == "auto":
+        hw = available_hw_encoders()
+        return hw[0] if hw else "libx264"
+    return choice
+
+def encoder_settings(encoder):
+    return HW_ENCODERS.get(encoder, SOFTWARE_ENCODER)
+
+def video_codec_args(encoder, preset=DEFAULT_PRESET, crf=DEFAULT_CRF):
+    # the x264 preset only applies to libx264; the CRF value maps onto each
+    # hardware encoder's own constant-quality setting
+    if encoder == "h264_nvenc":
+        quality = ["-rc", "vbr", "-cq", str(crf), "-b:v", "0"]
+    elif encoder == "h264_qsv":
+        quality = ["-global_quality", str(crf)]
+    elif encoder == "h264_videotoolbox":
+        quality = []  # no CRF equivalent that works on every Mac
+    else:
+        quality = ["-preset", preset, "-crf", str(crf)]
+    settings = encoder_settings(encoder)
+    return ["-c:v", encoder, *settings["args"], *quality, "-pix_fmt", settings["pix_fmt"]]
+
+def seek_args(item):
+    # -ss/-to given before -i: the demuxer jumps to the keyframe before the
+    # cut and, since we always transcode here, accurate_seek (on by default)
+    # drops the frames up to the exact start. That is frame-accurate already,
+    # so no second output-side -ss is needed.
+    s = float(item.get('start', 0) or 0)
+    e = float(item.get('end') or 0)
+    if e and e <= s:
+        raise ValueError(f"{os.path.basename(item['path'])}: end ({e}s) must be after start ({s}s)")
+    args = []
+    if s > 0:
+        args += ["-ss", str(s)]
+    if e:
+        # input-side -to is a position in the source, not a duration
+        args += ["-to", str(e)]
+    return args
+
+def input_args(item, fps, hwaccel=None):
+    if item['type'] == 'video':
+        args = ["-hwaccel", hwaccel] if hwaccel else []
+        return args + seek_args(item) + ["-i", item['path']]
+    dur = str(float(item.get('duration', 3)))
+    if item['path'].lower().endswith(".gif"):
+        return ["-ignore_loop", "0", "-t", dur, "-i", item['path']]
+    # the image is decoded once by ffmpeg and repeated at the export rate, so
+    # the fps filter has no frames to duplicate or drop
+    return ["-loop", "1", "-framerate", str(fps), "-t", dur, "-i", item['path']]
+
+AUDIO_CHAIN = f"aformat=sample_rates={AUDIO_RATE}:channel_layouts=stereo"
+
+def video_chain(width, height, fps):
+    # concat needs identical frame sizes, so letterbox into width x height
+    return (
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={fps},format=yuv420p"
+    )
+
+def tee_escape(path):
+    return path.replace("\\", "\\\\").replace("|", "\\|").replace("[", "\\[").replace("]", "\\]")
+
+def build_render_command(timeline, out_path, width, height, fps, encoder="libx264", hls_dir=None,
+                         preset=DEFAULT_PRESET, crf=DEFAULT_CRF):
+    settings = encoder_settings(encoder)
+    cmd = ["ffmpeg", "-hide_banner", "-y"]
+    filters = []
+    segments = ""
+    for i, item in enumerate(timeline):
+        cmd += input_args(item, fps, settings["hwaccel"])
+        filters.append(f"[{i}:v]{video_chain(width, height, fps)}[v{i}]")
+        if item['type'] == 'video' and has_audio(item['path']):
+            filters.append(f"[{i}:a]{AUDIO_CHAIN}[a{i}]")
+        else:
+            # concat pads a short audio segment with silence up to the video length
+            filters.append(f"anullsrc=r={AUDIO_RATE}:cl=stereo,atrim=duration=0.05[a{i}]")
+        segments += f"[v{i}][a{i}]"
+    filters.append(f"{segments}concat=n={len(timeline)}:v=1:a=1[outv][outa]")
+    cmd += [
+        "-filter_complex", ";".join(filters),
+        "-map", "[outv]", "-map", "[outa]",
+        *video_codec_args(encoder, preset, crf), "-r", str(fps),
+        "-c:a", "aac",
+    ]
+    if hls_dir is None:
+        return cmd + ["-movflags", "+faststart", out_path]
+    # encode once, mux twice: the final MP4 plus an fMP4 HLS event stream whose
+    # segments exist while the export is still running; forced keyframes keep
+    # the segments at HLS_SEGMENT_SECONDS instead of the encoder's GOP length
+    hls_opts = (
+        f"f=hls:hls_time={HLS_SEGMENT_SECONDS}:hls_playlist_type=event"
+        ":hls_segment_type=fmp4:hls_flags=omit_endlist"
+    )
+    return cmd + [
+        "-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+        "-f", "tee",
+        f"[f=mp4:movflags=+faststart]{tee_escape(out_path)}"
+        f"|[{hls_opts}]{tee_escape(os.path.join(hls_dir, HLS_PLAYLIST))}",
+    ]
+
+def ffmpeg_error(stderr):
+    # the last few lines of ffmpeg's log carry the actual error
+    return RuntimeError("ffmpeg failed:\n" + "\n".join(stderr.strip().splitlines()[-5:]))
+
+def run_ffmpeg(cmd):
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise ffmpeg_error(proc.stderr)
+
+# Live preview: while the export encodes, ffmpeg also writes an HLS event
+# stream. Its playlist only lists finished segments, and the fMP4 init segment
+# plus those fragments is itself a playable MP4, so the preview can be shown
+# long before the full file is done.
+HLS_SEGMENT_SECONDS = 2
+HLS_PLAYLIST = "index.m3u8"
+HLS_PREVIEW_SEGMENTS = 3
+
+def hls_segments(hls_dir):
+    try:
+        with open(os.path.join(hls_dir, HLS_PLAYLIST)) as f:
+            return [line for line in f.read().splitlines() if line and not line.startswith("#")]
+    except FileNotFoundError:
+        return []
+
+def hls_preview_bytes(hls_dir, max_segments):
+    segments = hls_segments(hls_dir)[:max_segments]
+    if not segments:
+        return None
+    data = bytearray()
+    for name in ["init.mp4", *segments]:
+        with open(os.path.join(hls_dir, name), "rb") as f:
+            data += f.read()
+    return bytes(data)
+
+def run_ffmpeg_with_preview(cmd, hls_dir, preview):
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    stderr = []
+    # drain stderr off-thread so a chatty ffmpeg never blocks on a full pipe
+    drain = threading.Thread(target=lambda: stderr.append(proc.communicate()[1]), daemon=True)
+    drain.start()
+    shown = False
+    while drain.is_alive():
+        if not shown and len(hls_segments(hls_dir)) >= HLS_PREVIEW_SEGMENTS:
+            preview.video(hls_preview_bytes(hls_dir, HLS_PREVIEW_SEGMENTS), format="video/mp4")
+            shown = True
+        drain.join(0.5)
+    if proc.returncode != 0:
+        raise ffmpeg_error(stderr[0] if stderr else "")
+
+# Parallel render: every item is encoded to its own MPEG-TS intermediate with
+# identical codec settings and a fixed GOP, then the pieces are joined with
+# the concat demuxer and -c copy. Workers only wait on ffmpeg processes, so
+# threads are enough; hardware encoders allow few concurrent sessions.
+HW_PARALLEL_SEGMENTS = 2
+
+def clip_duration(item):
+    if item['type'] != 'video':
+        return float(item.get('duration', 3))
+    s = float(item.get('start', 0) or 0)
+    e = float(item.get('end') or 0)
+    # some containers (raw streams, live captures) have no format duration
+    video = first_stream(item['path'], "video") or {}
+    length = ffprobe(item['path']).get("format", {}).get("duration") or video.get("duration")
+    if length is None:
+        # unknown length: let the input end the segment (None means no -t)
+        return e - s if e else None
+    length = float(length)
+    if s >= length:
+        raise ValueError(f"{os.path.basename(item['path'])}: start ({s}s) is past the end of the clip ({length:g}s)")
+    return (min(e, length) if e else length) - s
+
+def build_segment_command(item, seg_path, width, height, fps, encoder="libx264", threads=0,
+                          preset=DEFAULT_PRESET, crf=DEFAULT_CRF):
+    settings = encoder_settings(encoder)
+    duration = clip_duration(item)
+    cmd = ["ffmpeg", "-hide_banner", "-y", *input_args(item, fps, settings["hwaccel"])]
+    if item['type'] == 'video' and has_audio(item['path']):
+        # pad so each piece carries audio exactly as long as its video, or
+        # the joined file drifts out of sync
+        audio = f"[0:a]{AUDIO_CHAIN}" + (",apad[a]" if duration is not None else "[a]")
+    else:
+        audio = f"anullsrc=r={AUDIO_RATE}:cl=stereo[a]"
+    gop = str(fps * 2)
+    cmd += [
+        "-filter_complex", f"[0:v]{video_chain(width, height, fps)}[v];{audio}",
+        "-map", "[v]", "-map", "[a]",
+        # an explicit length rather than -shortest, which does not reliably
+        # stop on the endless apad stream; without a known length, fall back
+        # to -shortest and leave the audio unpadded
+        *(["-t", str(duration)] if duration is not None else ["-shortest"]),
+        *video_codec_args(encoder, preset, crf), "-r", str(fps), "-g", gop,
+    ]
+    if encoder == "libx264":
+        cmd += ["-x264-params", f"keyint={gop}:min-keyint={gop}:scenecut=0", "-threads", str(threads)]
+    return cmd + ["-c:a", "aac", "-f", "mpegts", seg_path]
+
+def render_segments_parallel(timeline, out_path, width, height, fps, encoder="libx264",
+                             preset=DEFAULT_PRESET, crf=DEFAULT_CRF):
+    cpus = os.cpu_count() or 1
+    workers = min(len(timeline), cpus if encoder == "libx264" else HW_PARALLEL_SEGMENTS)
+    # split the cores between the concurrent x264 instances
+    threads = max(1, cpus // workers)
+    with tempfile.TemporaryDirectory(prefix="segments_") as seg_dir:
+        seg_paths = [os.path.join(seg_dir, f"seg_{i:04d}.ts") for i in range(len(timeline))]
+        # build every command first so a bad clip fails before anything encodes
+        cmds = [
+            build_segment_command(item, seg_path, width, height, fps, encoder, threads, preset, crf)
+            for item, seg_path in zip(timeline, seg_paths)
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            jobs = [pool.submit(run_ffmpeg, cmd) for cmd in cmds]
+            try:
+                for job in as_completed(jobs):
+                    job.result()
+            except Exception:
+                # drop the queued clips; only the ones already running finish
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+        list_path = write_concat_list([{"path": p} for p in seg_paths], os.path.join(seg_dir, "list.txt"))
+        cmd = build_stream_copy_command(list_path, out_path)
+        # ADTS AAC from the TS pieces needs its headers rewritten for MP4
+        cmd[-1:-1] = ["-bsf:a", "aac_adtstoasc"]
+        run_ffmpeg(cmd)
+    return out_path
+
+def render_timeline_to_file(timeline, out_path, width, height, fps, encoder="libx264", preview=None, parallel=False,
+                            preset=DEFAULT_PRESET, crf=DEFAULT_CRF):
+    for item in timeline:
+        ensure_local(item)
+    if stream_copy_compatible(timeline, width, height, fps):
+        # a stream copy finishes in seconds, there is nothing to preview
+        list_path = write_concat_list(timeline, out_path + ".concat.txt")
+        try:
+            run_ffmpeg(build_stream_copy_command(list_path, out_path))
+        finally:
+            os.unlink(list_path)
+        return out_path
+    if parallel and len(timeline) > 1:
+        return render_segments_parallel(timeline, out_path, width, height, fps, encoder, preset, crf)
+    if preview is None:
+        run_ffmpeg(build_render_command(timeline, out_path, width, height, fps, encoder, preset=preset, crf=crf))
+        return out_path
+    with tempfile.TemporaryDirectory(prefix="hls_") as hls_dir:
+        cmd = build_render_command(timeline, out_path, width, height, fps, encoder, hls_dir, preset, crf)
+        run_ffmpeg_with_preview(cmd, hls_dir, preview)
+    return out_path
+
 # ---------------------- Session state ----------------------
 if "timeline" not in st.session_state:
     st.session_state.timeline = []  # each item: dict {"type":"video"|"image","path":..., "start":0, "end":None}
@@ -116,42 +738,47 @@ with col1:
         results = st.session_state.last_search
         for i, r in enumerate(results):
             if search_type == "Images":
-                thumb = r.get("src", {}).get("medium")
-                st.image(thumb, width=200)
+                st.image(thumb_source(image_thumb_url(r)), width=200)
                 if st.button(f"Add image {i}"):
                     # download best quality
                     img_url = r.get("src", {}).get("original")
-                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".jpg")
-                    download_url_to_file(img_url, tmp.name)
-                    st.session_state.timeline.append({"id": st.session_state.counter, "type": "image", "path": tmp.name, "duration": 3})
+                    path = download_url_to_file(img_url, ".jpg")
+                    st.session_state.timeline.append({"id": st.session_state.counter, "type": "image", "path": path, "url": img_url, "suffix": ".jpg", "duration": 3})
                     st.session_state.counter += 1
                     st.success("Image added to timeline")
             else:
                 # videos
-                thumb = r.get("image")
-                st.image(thumb, width=250)
+                st.image(thumb_source(video_thumb_url(r)), width=250)
                 # choose best file (highest width)
                 video_files = r.get("video_files", [])
                 if st.button(f"Add video {i}"):
-                    # pick highest quality
-                    chosen = sorted(video_files, key=lambda x: x.get("height", 0))[-1]
+                    # pick highest quality; some renditions report height as null
+                    chosen = max(video_files, key=lambda x: x.get("height") or 0, default={})
                     video_url = chosen.get("link")
-                    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-                    download_url_to_file(video_url, tmp.name)
-                    st.session_state.timeline.append({"id": st.session_state.counter, "type": "video", "path": tmp.name, "start": 0, "end": None})
-                    st.session_state.counter += 1
-                    st.success("Video added to timeline")
+                    if not video_url:
+                        st.warning("This video has no downloadable file")
+                    else:
+                        path = download_url_to_file(video_url, ".mp4")
+                        st.session_state.timeline.append({"id": st.session_state.counter, "type": "video", "path": path, "url": video_url, "suffix": ".mp4", "start": 0, "end": None})
+                        st.session_state.counter += 1
+                        st.success("Video added to timeline")
 
     st.markdown("---")
     st.subheader("Upload local files")
     uploaded = st.file_uploader("Upload image/video files", accept_multiple_files=True)
-    if uploaded:
-        for f in uploaded:
+    # the uploader keeps its files across reruns; copy each one only once
+    added_uploads = st.session_state.setdefault("added_uploads", set())
+    new_uploads = [f for f in uploaded or [] if f.file_id not in added_uploads]
+    if new_uploads:
+        for f in new_uploads:
             name = f.name
             suffix = name.split('.')[-1].lower()
             tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.' + suffix)
-            tmp.write(f.getbuffer())
-            tmp.flush()
+            # stream to disk in 1 MiB chunks instead of materialising the whole upload
+            f.seek(0)
+            shutil.copyfileobj(f, tmp, length=1024 * 1024)
+            tmp.close()
+            added_uploads.add(f.file_id)
             if suffix in ["png", "jpg", "jpeg", "gif"]:
                 st.session_state.timeline.append({"id": st.session_state.counter, "type": "image", "path": tmp.name, "duration": 3})
             else:
@@ -159,81 +786,105 @@ with col1:
             st.session_state.counter += 1
         st.success("Uploaded files added to timeline")
 
-with col2:
+# The timeline is a fragment: its widgets (reorder table, clip forms, preview
+# and remove buttons) rerun only this function, not the search column. Reorder
+# and remove go through callbacks, which run before the fragment re-executes,
+# so neither needs an explicit st.rerun.
+def apply_order_edit(editor_key, ids):
+    # each edited row is a move to the typed position (clamped to 1..n). On a
+    # tie the moved clip wins: a clip moved up lands before the one already
+    # there, a clip moved down lands after it.
+    edits = st.session_state[editor_key]["edited_rows"]
+    n = len(ids)
+    keys = []
+    for row, clip_id in enumerate(ids):
+        order = edits.get(row, {}).get("order")
+        if order is None:
+            keys.append((row + 1, 1, row, clip_id))
+            continue
+        order = min(max(int(order), 1), n)
+        tie = 0 if order < row + 1 else 2 if order > row + 1 else 1
+        keys.append((order, tie, row, clip_id))
+    by_id = {item['id']: item for item in st.session_state.timeline}
+    st.session_state.timeline = [by_id[clip_id] for *_, clip_id in sorted(keys)]
+
+def remove_clip(clip_id):
+    st.session_state.timeline = [item for item in st.session_state.timeline if item['id'] != clip_id]
+
+@st.fragment
+def render_timeline():
     st.subheader("Timeline")
     if not st.session_state.timeline:
         st.info("No clips in timeline. Add search results or upload files from the left.")
     else:
-        to_remove = None
+        # reorder by editing the "order" column: one edit, one rerun, however far
+        # a clip moves
+        ids = [item['id'] for item in st.session_state.timeline]
+        order_df = pd.DataFrame({
+            "order": range(1, len(ids)+1),
+            "id": ids,
+            "type": [item['type'] for item in st.session_state.timeline],
+            "file": [os.path.basename(item['path']) for item in st.session_state.timeline],
+        })
+        # the key follows the current order so stale edits never apply to a reordered frame
+        editor_key = "tl_" + "-".join(map(str, ids))
+        st.data_editor(
+            order_df, num_rows="fixed", hide_index=True, disabled=["id", "type", "file"],
+            key=editor_key, on_change=apply_order_edit, args=(editor_key, ids),
+        )
+
         for idx, item in enumerate(st.session_state.timeline):
-            st.markdown(f"**Clip {idx+1} — ({item['type']}) id={item['id']}**")
-            st.write(item['path'])
-            c1, c2, c3, c4 = st.columns([1,1,1,2])
-            if item['type'] == 'video':
-                if c1.button('Preview', key=f'preview_{item["id"]}'):
-                    st.video(item['path'])
-                start = c2.number_input('Start (s)', min_value=0.0, value=float(item.get('start',0)), key=f'start_{item["id"]}')
-                end = c3.number_input('End (s or 0 for full)', min_value=0.0, value=float(item.get('end') or 0.0), key=f'end_{item["id"]}')
-                item['start'] = start
-                item['end'] = end if end>0 else None
-            else:
-                if c1.button('Preview', key=f'preview_img_{item["id"]}'):
-                    st.image(item['path'])
-                duration = c2.number_input('Duration (s)', min_value=0.5, value=float(item.get('duration',3)), key=f'dur_{item["id"]}')
-                item['duration'] = duration
-            if c4.button('Remove', key=f'remove_{item["id"]}'):
-                to_remove = idx
-            # reorder controls
-            r1, r2 = st.columns([1,1])
-            if r1.button('Move Up', key=f'moveup_{item["id"]}') and idx>0:
-                st.session_state.timeline[idx-1], st.session_state.timeline[idx] = st.session_state.timeline[idx], st.session_state.timeline[idx-1]
-            if r2.button('Move Down', key=f'movedown_{item["id"]}') and idx < len(st.session_state.timeline)-1:
-                st.session_state.timeline[idx+1], st.session_state.timeline[idx] = st.session_state.timeline[idx], st.session_state.timeline[idx+1]
-            st.markdown('---')
-        if to_remove is not None:
-            st.session_state.timeline.pop(to_remove)
-            st.experimental_rerun()
+            # collapsed rows keep the page short; the trim/duration inputs sit
+            # in a form so edits are applied in one rerun on submit
+            with st.expander(f"Clip {idx+1} — ({item['type']}) {os.path.basename(item['path'])}", expanded=False):
+                st.caption(f"id={item['id']} · {item['path']}")
+                with st.form(key=f'form_{item["id"]}'):
+                    c1, c2 = st.columns(2)
+                    if item['type'] == 'video':
+                        start = c1.number_input('Start (s)', min_value=0.0, value=float(item.get('start',0)), key=f'start_{item["id"]}')
+                        end = c2.number_input('End (s or 0 for full)', min_value=0.0, value=float(item.get('end') or 0.0), key=f'end_{item["id"]}')
+                    else:
+                        duration = c1.number_input('Duration (s)', min_value=0.5, value=float(item.get('duration',3)), key=f'dur_{item["id"]}')
+                    if st.form_submit_button('Apply'):
+                        if item['type'] == 'video':
+                            item['start'] = start
+                            item['end'] = end if end>0 else None
+                        else:
+                            item['duration'] = duration
+                b1, b2 = st.columns([1,1])
+                if b1.button('Preview', key=f'preview_{item["id"]}'):
+                    if item['type'] == 'video':
+                        st.video(ensure_local(item))
+                    else:
+                        st.image(ensure_local(item))
+                b2.button('Remove', key=f'remove_{item["id"]}', on_click=remove_clip, args=(item['id'],))
+
+with col2:
+    render_timeline()
 
 st.sidebar.title("Export & Settings")
 fps = st.sidebar.number_input("Export FPS", min_value=15, max_value=60, value=24)
 resolution_w = st.sidebar.number_input("Width", min_value=240, max_value=3840, value=1280)
 resolution_h = st.sidebar.number_input("Height", min_value=240, max_value=2160, value=720)
+encoder_choice = st.sidebar.selectbox("Encoder", ["auto", "libx264", *available_hw_encoders()])
+encode_preset = st.sidebar.selectbox("Encode preset", X264_PRESETS, index=X264_PRESETS.index(DEFAULT_PRESET), help="libx264 only: faster presets trade a little compression for a lot of speed.")
+encode_crf = st.sidebar.slider("CRF", 18, 30, DEFAULT_CRF, help="Lower is higher quality and larger files.")
 
 st.sidebar.subheader("Export final video")
 output_name = st.sidebar.text_input("Output filename", value="final_video.mp4")
+parallel_render = st.sidebar.checkbox("Encode clips in parallel", value=False, help="Encodes each clip on its own CPU core and joins them without re-encoding. Fastest for long timelines; no live preview.")
+live_preview = st.sidebar.checkbox("Preview while rendering", value=False, help="Shows the first seconds of the export as soon as they are encoded. Forces a keyframe every 2 s, which makes the final file slightly larger.")
 if st.sidebar.button("Render & Export"):
     if not st.session_state.timeline:
         st.sidebar.warning("Timeline is empty")
     else:
         with st.spinner("Rendering — this may take a while..."):
-            clips = []
             try:
-                for item in st.session_state.timeline:
-                    if item['type'] == 'video':
-                        clip = VideoFileClip(item['path'])
-                        s = float(item.get('start', 0) or 0)
-                        e = item.get('end', None)
-                        if e:
-                            clip = clip.subclip(s, float(e))
-                        else:
-                            if s>0:
-                                clip = clip.subclip(s)
-                        # resize to target resolution width while keeping aspect ratio
-                        clip = clip.resize(width=resolution_w)
-                        clips.append(clip)
-                    else:
-                        img = Image.open(item['path']).convert('RGB')
-                        # create ImageClip with duration
-                        dur = float(item.get('duration', 3))
-                        ic = ImageClip(item['path']).set_duration(dur)
-                        ic = ic.resize(width=resolution_w)
-                        clips.append(ic)
-
-                final = concatenate_videoclips(clips, method="compose")
-                final = final.set_fps(fps)
                 out_path = os.path.join(tempfile.gettempdir(), output_name)
-                # optional: set audio
-                final.write_videofile(out_path, codec='libx264', audio_codec='aac')
+                preview = st.empty() if live_preview else None
+                render_timeline_to_file(st.session_state.timeline, out_path, resolution_w, resolution_h, fps, resolve_encoder(encoder_choice), preview, parallel_render, encode_preset, encode_crf)
+                if preview is not None:
+                    preview.empty()
                 st.success("Export complete")
                 st.video(out_path)
                 # create download button
@@ -244,9 +895,9 @@ if st.sidebar.button("Render & Export"):
 
 st.sidebar.markdown('---')
 st.sidebar.markdown('Tips:')
-st.sidebar.markdown('- Install ffmpeg on your machine; MoviePy needs it.')
+st.sidebar.markdown('- Install ffmpeg on your machine; rendering runs it directly.')
 st.sidebar.markdown('- Provide a PEXELS_API_KEY in Streamlit secrets or environment variables for online search.')
 
 # Footer
 st.markdown("---")
-st.caption("Built with Streamlit + MoviePy — simple editor for assembling clips and images")
+st.caption("Built with Streamlit + ffmpeg — simple editor for assembling clips and images")